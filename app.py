@@ -6,16 +6,27 @@ Fixes: conversation continuity, top_k properly passed to retriever and prompt
 import os
 import uuid
 import time
+import html
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
 from dotenv import load_dotenv
 
 load_dotenv()
 
 from components.safety import classify_intent, is_blocked, get_safe_response
-from components.retriever import get_retriever
-from components.prompts import build_prompt, should_ask_clarification, LOW_CONFIDENCE_RESPONSE
-from components.gemini import init_gemini, call_gemini
-from components.logger import log_interaction
+from components.retriever import get_retriever, retriever_ready, warm_retriever
+from components.prompts import (
+    build_prompt, build_context_block, should_ask_clarification,
+    LOW_CONFIDENCE_RESPONSE, PROMPT_CONFIG, PROMPT_VERSION,
+    HISTORY_MAX_MESSAGES, HISTORY_TOKEN_BUDGET, estimate_tokens, select_history
+)
+from components.gemini import (
+    init_gemini, call_gemini_stream, validate_response, AnswerLeakage, LEAKAGE_BLOCK,
+    create_context_cache, delete_context_cache, CONTEXT_CACHE_TTL
+)
+from components.logger import log_interaction, start_log_writer
+from components.semantic_cache import SemanticCache
 
 st.set_page_config(
     page_title="EduBot — Course Explainer",
@@ -24,7 +35,8 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
-st.markdown("""
+# Static page chrome: plain string constants, nothing to build or cache per rerun
+_CSS = """
 <style>
     .main-header {
         background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
@@ -63,23 +75,81 @@ st.markdown("""
         padding: 0.3rem 0.8rem; font-size: 0.78rem; color: #1d4ed8; margin-bottom: 0.4rem;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+st.markdown(_CSS, unsafe_allow_html=True)
 
 # ── SESSION STATE ──
 if "session_id"       not in st.session_state: st.session_state.session_id       = str(uuid.uuid4())
-if "chat_history"     not in st.session_state: st.session_state.chat_history     = []   # for Gemini API (role+content only)
-if "display_messages" not in st.session_state: st.session_state.display_messages = []   # for UI rendering (full data)
-if "request_count"    not in st.session_state: st.session_state.request_count    = 0
-if "last_reset"       not in st.session_state: st.session_state.last_reset       = time.time()
+if "turns"            not in st.session_state: st.session_state.turns            = []   # single store: UI render + Gemini history
+if "tokens"           not in st.session_state: st.session_state.tokens           = 10.0   # rate-limit token bucket (starts full)
+if "last_refill"      not in st.session_state: st.session_state.last_refill      = time.time()
 if "quick_query"      not in st.session_state: st.session_state.quick_query      = None
+if "context_caches"   not in st.session_state: st.session_state.context_caches   = {}     # (intent, chunk ids) → (cache name | None, expires_at)
+if "context_seen"     not in st.session_state: st.session_state.context_seen     = {}     # (intent, chunk ids) → first use expires_at
+
+@st.cache_resource(show_spinner=False)
+def _warm_retriever():
+    """Starts building the retriever at boot, while the page renders."""
+    return warm_retriever()
+
+@st.cache_resource(show_spinner="⏳ Embedding knowledge base (once per server)...")
+def _load_retriever():
+    return get_retriever()   # waits for the warm-up build if it is still running
+
+@st.cache_resource(show_spinner=False)
+def _init_gemini(api_key_hash):
+    """Configures the Gemini client once per API key, shared across sessions."""
+    init_gemini()
+    return True
+
+def _api_key_hash():
+    api_key = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY") or ""
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+@st.cache_resource(show_spinner=False)
+def _retrieval_executor():
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="edubot-retrieval")
+
+@st.cache_resource(show_spinner=False)
+def _start_log_writer():
+    return start_log_writer()
+
+@st.cache_resource(show_spinner=False)
+def _response_cache(dim, kb_version, prompt_version):
+    """Answers are only valid for the KB, embedder and prompt/model they came from."""
+    return SemanticCache(dim, namespace=f"{kb_version}_{prompt_version}")
+
+_warm_retriever()
+_start_log_writer()
+
+QUICK_QUESTIONS = [
+    ("📚 Course Structure",  "How is a course structured on this platform?"),
+    ("📝 Assessment Types",  "What types of assessments are there and how are they graded?"),
+    ("🏅 Get Certificate",   "How do I earn a certificate and what are the eligibility requirements?"),
+    ("📊 Track Progress",    "How can I track my course progress and view my completion percentage?"),
+]
 
-if "retriever" not in st.session_state:
-    with st.spinner("⏳ Loading Knowledge Base and building FAISS index..."):
-        st.session_state.retriever = get_retriever()
+@st.cache_resource(show_spinner=False)
+def precompute_quick(_retriever, retriever_id):
+    """
+    Embeds the quick questions once (single encode call) and memoizes their
+    vectors and retrieval results for every Top-K slider value.
+    retriever_id keys the cache, so a rebuilt retriever/KB recomputes it.
+    """
+    questions = [q for _, q in QUICK_QUESTIONS]
+    vecs      = _retriever.encode(questions)
+    return {
+        q: {
+            "vec":     vec,
+            "results": {k: _retriever.retrieve_precomputed(vec, classify_intent(q), k) for k in range(1, 9)},
+        }
+        for q, vec in zip(questions, vecs)
+    }
 
 if "gemini_ready" not in st.session_state:
     try:
-        init_gemini()
+        _init_gemini(_api_key_hash())
         st.session_state.gemini_ready = True
     except ValueError as e:
         st.session_state.gemini_ready = False
@@ -97,14 +167,76 @@ INTENT_BADGE = {
     "blocked":       ("🚫 Blocked",       "badge-blocked"),
 }
 
+# Badge HTML depends only on the intent literal — build it once at import
+INTENT_BADGE_HTML = {
+    intent: f'<span class="intent-badge {css}">{label}</span>'
+    for intent, (label, css) in INTENT_BADGE.items()
+}
+
+SOURCE_CARD_TMPL = (
+    '<div class="source-card"><b>Chunk {i}:</b> 🗂️ <b>{title}</b>'
+    ' — <i>{category}</i> | Relevance: <b>{score:.3f}</b></div>'
+)
+
+def sources_html(sources):
+    """All source cards as one HTML string → one st.markdown call per expander."""
+    return "".join(
+        SOURCE_CARD_TMPL.format(
+            i=i, title=html.escape(src["title"]),
+            category=html.escape(src["category"].title()), score=src["score"]
+        )
+        for i, src in enumerate(sources, 1)
+    )
+
+CHUNK_INFO_HISTORY_TMPL = '<div class="chunk-info">🔍 <b>{n} KB chunks</b> retrieved (Top-K={n})</div>'
+CHUNK_INFO_LIVE_TMPL    = (
+    '<div class="chunk-info">🔍 Retrieved <b>{n} chunks</b> '
+    '(Top-K={top_k}) in {ms:.0f}ms</div>'
+)
+
+def get_context_cache(intent, chunks, top_k):
+    """
+    Returns the Gemini context cache name for this (intent, chunk set), or None
+    to send the context inline. The cache is only created when the same prefix
+    repeats within CONTEXT_CACHE_TTL: most chunk sets are used once, and
+    creating a cache is a blocking round trip before generation.
+    """
+    key   = hash((intent, tuple(c.id for c in chunks)))
+    now   = time.time()
+    entry = st.session_state.context_caches.get(key)
+    if entry is not None and entry[1] > now:
+        return entry[0]
+
+    seen = st.session_state.context_seen
+    if seen.get(key, 0) <= now:   # first use (in this window): inline
+        for k in [k for k, expires_at in seen.items() if expires_at <= now]:
+            del seen[k]
+        seen[key] = now + CONTEXT_CACHE_TTL
+        return None
+
+    name  = create_context_cache(build_context_block(chunks, top_k))
+    entry = (name, now + CONTEXT_CACHE_TTL - 10)   # expire locally just before the server does
+    st.session_state.context_caches[key] = entry
+    return entry[0]
+
+def clear_context_caches():
+    for name, _ in st.session_state.context_caches.values():
+        if name:
+            delete_context_cache(name)
+    st.session_state.context_caches = {}
+    st.session_state.context_seen   = {}
+
 def check_rate_limit():
+    """Token bucket: refills RATE_LIMIT tokens per RATE_WINDOW, bursts up to RATE_LIMIT."""
     now = time.time()
-    if now - st.session_state.last_reset > RATE_WINDOW:
-        st.session_state.request_count = 0
-        st.session_state.last_reset    = now
-    if st.session_state.request_count >= RATE_LIMIT:
+    st.session_state.tokens = min(
+        RATE_LIMIT,
+        st.session_state.tokens + (now - st.session_state.last_refill) * (RATE_LIMIT / RATE_WINDOW)
+    )
+    st.session_state.last_refill = now
+    if st.session_state.tokens < 1:
         return False
-    st.session_state.request_count += 1
+    st.session_state.tokens -= 1
     return True
 
 # ── SIDEBAR ──
@@ -117,7 +249,7 @@ with st.sidebar:
         if api_key_input:
             os.environ["GEMINI_API_KEY"] = api_key_input
             try:
-                init_gemini()
+                _init_gemini(_api_key_hash())
                 st.session_state.gemini_ready = True
                 st.success("✅ API Key accepted!")
                 st.rerun()
@@ -125,7 +257,7 @@ with st.sidebar:
                 st.error(f"❌ {e}")
     else:
         st.success("✅ Gemini Connected")
-        st.caption("Model: **gemini-2.5-flash-lite**")
+        st.caption(f"Model: **{PROMPT_CONFIG['model']}**")
 
     st.divider()
     st.markdown("#### ⚙️ RAG Settings")
@@ -140,27 +272,33 @@ with st.sidebar:
 
     st.divider()
     st.markdown("#### 📖 Knowledge Base")
-    try:
-        stats   = st.session_state.retriever.get_stats()
-        icon_map = {"course":"📚","assessment":"📝","certification":"🏅","progress":"📊"}
-        for cat, count in stats["by_category"].items():
-            st.markdown(f"{icon_map.get(cat,'•')} **{cat.title()}**: {count} articles")
-        st.markdown(f"🗂️ **Total**: {stats['total_articles']} articles")
-    except Exception:
-        st.markdown("🗂️ **Total**: 100 articles")
+    if not retriever_ready():
+        st.caption("⏳ Loading knowledge base...")
+    else:
+        try:
+            stats   = get_retriever().get_stats()
+            icon_map = {"course":"📚","assessment":"📝","certification":"🏅","progress":"📊"}
+            for cat, count in stats["by_category"].items():
+                st.markdown(f"{icon_map.get(cat,'•')} **{cat.title()}**: {count} articles")
+            st.markdown(f"🗂️ **Total**: {stats['total_articles']} articles")
+        except Exception:
+            st.markdown("🗂️ **Total**: 100 articles")
 
     st.divider()
     st.markdown("#### 💬 Conversation")
-    turns = len([m for m in st.session_state.display_messages if m["role"] == "user"])
-    st.caption(f"Turns: **{turns}** | Context window: last **6 turns**")
+    turns = sum(1 for t in st.session_state.turns if t["role"] == "user")
+    st.caption(
+        f"Turns: **{turns}** | Context window: last **{HISTORY_MAX_MESSAGES // 2} turns**, "
+        f"≤{HISTORY_TOKEN_BUDGET} tokens"
+    )
 
     st.divider()
     c1, c2 = st.columns(2)
     with c1:
         if st.button("🗑️ Clear Chat", use_container_width=True):
-            st.session_state.chat_history     = []
-            st.session_state.display_messages = []
+            st.session_state.turns            = []
             st.session_state.quick_query      = None
+            clear_context_caches()
             st.rerun()
     with c2:
         if st.button("📞 Support", use_container_width=True):
@@ -168,53 +306,43 @@ with st.sidebar:
 
     st.divider()
     st.caption(f"Session: `{st.session_state.session_id[:8]}...`")
-    st.caption(f"Requests/min: {st.session_state.request_count}/{RATE_LIMIT}")
+    st.caption(f"Tokens: {st.session_state.tokens:.1f}/{RATE_LIMIT}")
 
 # ── HEADER ──
-st.markdown("""
+_HEADER_HTML = """
 <div class="main-header">
     <h1>🎓 EduBot — Course & Learning Workflow Explainer</h1>
     <p>Ask me anything about course navigation, assessments, certification workflows, or progress tracking.</p>
 </div>
-""", unsafe_allow_html=True)
+"""
+
+st.markdown(_HEADER_HTML, unsafe_allow_html=True)
 
 # ── QUICK BUTTONS ──
 st.markdown("**Quick Questions:**")
 cols = st.columns(4)
-quick_questions = [
-    ("📚 Course Structure",  "How is a course structured on this platform?"),
-    ("📝 Assessment Types",  "What types of assessments are there and how are they graded?"),
-    ("🏅 Get Certificate",   "How do I earn a certificate and what are the eligibility requirements?"),
-    ("📊 Track Progress",    "How can I track my course progress and view my completion percentage?"),
-]
-for col, (label, question) in zip(cols, quick_questions):
+for col, (label, question) in zip(cols, QUICK_QUESTIONS):
     with col:
         if st.button(label, use_container_width=True, key=f"qbtn_{label}"):
             st.session_state.quick_query = question
 
 # ── RENDER CHAT HISTORY ──
-for msg in st.session_state.display_messages:
+for msg in st.session_state.turns:
     with st.chat_message(msg["role"]):
         if msg["role"] == "assistant":
-            badge_label, badge_css = INTENT_BADGE.get(msg.get("intent","general"), ("💬","badge-general"))
-            st.markdown(f'<span class="intent-badge {badge_css}">{badge_label}</span>', unsafe_allow_html=True)
+            st.markdown(
+                INTENT_BADGE_HTML.get(msg.get("intent", "general"), INTENT_BADGE_HTML["general"]),
+                unsafe_allow_html=True
+            )
             chunk_count = msg.get("chunk_count", 0)
             if chunk_count > 0:
-                st.markdown(
-                    f'<div class="chunk-info">🔍 <b>{chunk_count} KB chunks</b> retrieved (Top-K={chunk_count})</div>',
-                    unsafe_allow_html=True
-                )
+                st.markdown(CHUNK_INFO_HISTORY_TMPL.format(n=chunk_count), unsafe_allow_html=True)
 
         st.markdown(msg["content"])
 
         if msg["role"] == "assistant" and msg.get("sources"):
             with st.expander(f"📎 {len(msg['sources'])} sources used", expanded=False):
-                for i, src in enumerate(msg["sources"], 1):
-                    st.markdown(
-                        f'<div class="source-card"><b>Chunk {i}:</b> 🗂️ <b>{src["title"]}</b>'
-                        f' — <i>{src["category"].title()}</i> | Relevance: <b>{src["score"]:.3f}</b></div>',
-                        unsafe_allow_html=True
-                    )
+                st.markdown(sources_html(msg["sources"]), unsafe_allow_html=True)
 
         if msg["role"] == "assistant" and msg.get("latency", 0) > 0:
             st.caption(f"⚡ {msg['latency']:.2f}s")
@@ -223,6 +351,7 @@ for msg in st.session_state.display_messages:
 user_input = st.chat_input("Ask about courses, assessments, certifications, or progress tracking...")
 
 active_query = st.session_state.quick_query or user_input
+from_quick   = bool(st.session_state.quick_query)
 if st.session_state.quick_query:
     st.session_state.quick_query = None
 
@@ -238,33 +367,44 @@ if active_query:
     with st.chat_message("user"):
         st.markdown(query)
 
-    # Add to both histories
-    st.session_state.display_messages.append({"role": "user", "content": query})
-    st.session_state.chat_history.append({"role": "user", "content": query})
+    st.session_state.turns.append({"role": "user", "content": query, "token_count": estimate_tokens(query)})
 
     # Rate limit
     if not check_rate_limit():
-        wait_time = int(RATE_WINDOW - (time.time() - st.session_state.last_reset))
+        wait_time = int((1 - st.session_state.tokens) * RATE_WINDOW / RATE_LIMIT) + 1
         with st.chat_message("assistant"):
-            st.warning(f"⏳ Rate limit reached (10 requests/min). Try again in **{wait_time} seconds**.")
+            st.warning(f"⏳ Rate limit reached ({RATE_LIMIT} requests/min). Try again in **{wait_time} seconds**.")
         st.stop()
 
+    retriever      = _load_retriever()
+    response_cache = _response_cache(retriever.dim, retriever.kb_version, PROMPT_VERSION)
+    quick_results  = precompute_quick(retriever, id(retriever))
+
+    # Start the (intent-independent) embed + search while the safety and intent
+    # checks run; the candidate pool is ranked by intent once both are done.
+    retrieval_future = None
+    if st.session_state.get("gemini_ready") and not (from_quick and query in quick_results):
+        t0 = time.time()
+        retrieval_future = _retrieval_executor().submit(
+            retriever.search_candidates, query, current_top_k
+        )
+
     safety_triggered = is_blocked(query)
     intent           = classify_intent(query)
 
     with st.chat_message("assistant"):
-        badge_label, badge_css = INTENT_BADGE.get(intent, ("💬", "badge-general"))
-        st.markdown(f'<span class="intent-badge {badge_css}">{badge_label}</span>', unsafe_allow_html=True)
+        st.markdown(INTENT_BADGE_HTML.get(intent, INTENT_BADGE_HTML["general"]), unsafe_allow_html=True)
 
         # ── BLOCKED ──
         if safety_triggered:
+            if retrieval_future:
+                retrieval_future.cancel()
             response = get_safe_response()
             st.markdown(response)
-            st.session_state.display_messages.append({
+            st.session_state.turns.append({
                 "role":"assistant","content":response,
                 "intent":"blocked","sources":[],"chunk_count":0,"latency":0
             })
-            st.session_state.chat_history.append({"role":"assistant","content":response})
             log_interaction(st.session_state.session_id, query, "blocked", [], 0, True, response)
 
         elif not st.session_state.get("gemini_ready"):
@@ -273,91 +413,133 @@ if active_query:
         else:
             # ── STEP 1: RETRIEVE exactly current_top_k chunks ──
             with st.spinner(f"🔍 Retrieving top {current_top_k} knowledge base chunks..."):
-                t0 = time.time()
-                chunks = st.session_state.retriever.retrieve(
-                    query=query,
-                    category_filter=intent,
-                    top_k=current_top_k     # ← EXACTLY what slider says
-                )
+                if retrieval_future is None:
+                    t0 = time.time()
+                    chunks, unfiltered_chunks = quick_results[query]["results"][current_top_k]
+                else:
+                    # One search ranked both ways: intent-preferred and unfiltered
+                    chunks, unfiltered_chunks = retriever.rank_candidates(
+                        retrieval_future.result(),
+                        category_filter=intent,
+                        top_k=current_top_k     # ← EXACTLY what slider says
+                    )
                 retrieval_ms = (time.time() - t0) * 1000
 
+            # Low confidence within the intent's category → try the unfiltered ranking
+            if should_ask_clarification(chunks) and not should_ask_clarification(unfiltered_chunks):
+                chunks = unfiltered_chunks
+
             if should_ask_clarification(chunks):
                 response = LOW_CONFIDENCE_RESPONSE
                 st.markdown(response)
-                st.session_state.display_messages.append({
+                st.session_state.turns.append({
                     "role":"assistant","content":response,
                     "intent":intent,"sources":[],"chunk_count":0,"latency":0
                 })
-                st.session_state.chat_history.append({"role":"assistant","content":response})
 
             else:
                 # Show retrieval info
                 st.markdown(
-                    f'<div class="chunk-info">🔍 Retrieved <b>{len(chunks)} chunks</b> '
-                    f'(Top-K={current_top_k}) in {retrieval_ms:.0f}ms</div>',
+                    CHUNK_INFO_LIVE_TMPL.format(n=len(chunks), top_k=current_top_k, ms=retrieval_ms),
                     unsafe_allow_html=True
                 )
 
-                # ── STEP 2: BUILD PROMPT with ALL chunks + conversation history ──
-                messages_for_gemini = build_prompt(
-                    user_query=query,
-                    retrieved_chunks=chunks,
-                    chat_history=st.session_state.chat_history,  # full conversation
-                    intent=intent,
-                    top_k=current_top_k
-                )
+                # Sliding window: last HISTORY_MAX_MESSAGES turns + the current user message,
+                # further trimmed to HISTORY_TOKEN_BUDGET by select_history / build_prompt.
+                # build_prompt only reads role/content, so the turn dicts pass through as-is.
+                recent_turns            = st.session_state.turns[-(HISTORY_MAX_MESSAGES + 1):]
+                history, history_tokens = select_history(recent_turns)
+
+                # Semantic response cache — only when no history is sent;
+                # otherwise the answer depends on the history, not just the question.
+                # Reuses the retrieval embedding: no second forward pass. A hit must
+                # come from the same chunks, so the sources shown below are its sources.
+                source_ids = [c.id for c in chunks]
+                query_vec  = None
+                if not history:
+                    query_vec = (
+                        quick_results[query]["vec"] if retrieval_future is None
+                        else retrieval_future.result().query_vec
+                    )
+                cached_response = response_cache.lookup(query_vec, source_ids) if query_vec is not None else None
 
-                # ── STEP 3: CALL GEMINI ──
                 try:
-                    with st.spinner("🤖 Generating response..."):
-                        response, latency = call_gemini(messages_for_gemini)
-
-                    st.markdown(response)
+                    if cached_response is not None:
+                        response, latency = cached_response, 0.0
+                        st.markdown(response)
+
+                    else:
+                        # ── STEP 2: BUILD PROMPT with ALL chunks + conversation history ──
+                        # System prompt + KB chunk block live in a context cache when possible;
+                        # only history and the new question are sent each turn.
+                        cache_name = get_context_cache(intent, chunks, current_top_k)
+                        messages_for_gemini = build_prompt(
+                            user_query=query,
+                            retrieved_chunks=chunks,
+                            chat_history=recent_turns,
+                            intent=intent,
+                            top_k=current_top_k,
+                            include_context=cache_name is None
+                        )
+
+                        # ── STEP 3: CALL GEMINI ──
+                        # Stream tokens as they arrive; re-render if the leakage check fails
+                        placeholder = st.empty()
+                        t0 = time.time()
+                        try:
+                            with placeholder:
+                                response = st.write_stream(call_gemini_stream(
+                                    messages_for_gemini, cached_content=cache_name
+                                ))
+                            is_safe, response = validate_response(response)
+                        except AnswerLeakage:
+                            is_safe, response = False, LEAKAGE_BLOCK
+                        latency = time.time() - t0
+
+                        if not is_safe:
+                            placeholder.markdown(response)
+                        elif query_vec is not None:
+                            response_cache.add(query_vec, response, source_ids)
 
                     sources = [{"title":c.title,"category":c.category,"score":c.score} for c in chunks]
                     with st.expander(f"📎 {len(sources)} sources used", expanded=False):
-                        for i, src in enumerate(sources, 1):
-                            st.markdown(
-                                f'<div class="source-card"><b>Chunk {i}:</b> 🗂️ <b>{src["title"]}</b>'
-                                f' — <i>{src["category"].title()}</i> | Relevance: <b>{src["score"]:.3f}</b></div>',
-                                unsafe_allow_html=True
-                            )
-
-                    conv_turns = len(st.session_state.chat_history) // 2
+                        st.markdown(sources_html(sources), unsafe_allow_html=True)
+
+                    conv_turns = len(history) // 2
                     st.caption(
                         f"⚡ {latency:.2f}s | 📚 {len(chunks)}/{current_top_k} chunks | "
-                        f"🔍 {retrieval_ms:.0f}ms retrieval | 💬 {conv_turns} turns in context"
+                        f"🔍 {retrieval_ms:.0f}ms retrieval | "
+                        f"💬 {conv_turns} turns in context (~{history_tokens} tokens)"
                     )
 
-                    # Save to display_messages (UI)
-                    st.session_state.display_messages.append({
+                    st.session_state.turns.append({
                         "role":"assistant","content":response,
                         "intent":intent,"sources":sources,
-                        "chunk_count":len(chunks),"latency":latency
+                        "chunk_count":len(chunks),"latency":latency,
+                        "token_count":estimate_tokens(response)
                     })
 
-                    # Save to chat_history (Gemini conversation continuity)
-                    st.session_state.chat_history.append({"role":"assistant","content":response})
-
                     log_interaction(
                         st.session_state.session_id, query, intent,
-                        [c.title for c in chunks], latency, False, response
+                        [c.title for c in chunks], latency, False, response,
+                        history_tokens=history_tokens
                     )
 
                 except Exception as e:
                     err = f"⚠️ Error calling Gemini API: {str(e)}\n\nPlease check your API key."
                     st.error(err)
-                    st.session_state.display_messages.append({
+                    st.session_state.turns.append({
                         "role":"assistant","content":err,
                         "intent":intent,"sources":[],"chunk_count":0,"latency":0
                     })
-                    st.session_state.chat_history.append({"role":"assistant","content":err})
 
 # ── FOOTER ──
-st.markdown("---")
-st.markdown(
+_FOOTER_HTML = (
     "<div style='text-align:center;color:#9ca3af;font-size:0.8rem;'>"
-    "🎓 EduBot — Project 42 | Gemini Flash + FAISS RAG | "
+    "🎓 EduBot — Project 42 | Gemini Flash + RAG | "
     "Academic integrity enforced — assessment answers are never provided."
-    "</div>", unsafe_allow_html=True
-)
\ No newline at end of file
+    "</div>"
+)
+
+st.markdown("---")
+st.markdown(_FOOTER_HTML, unsafe_allow_html=True)
\ No newline at end of file
@@ -0,0 +1,36 @@
+"""
+_kernels.py - Optional Numba kernels for the retrieval hot path
+Imported only if numba is installed; retriever.py falls back to NumPy otherwise.
+"""
+
+import numpy as np
+from numba import njit
+
+
+# Only the flags that speed up the dot product (FMA contraction, reassociation for
+# SIMD). Not fastmath=True: that also assumes no infinities, and the top-k buffer
+# starts filled with -inf.
+@njit(cache=True, fastmath={"contract", "reassoc"})
+def dot_topk(emb, q, k):
+    """
+    Fused dot product + top-k over the rows of emb (N, d) for one query q (d,).
+    Single pass over the matrix, no (N,) scores array: a sorted top-k buffer
+    is updated by insertion as each row's score is computed.
+    Returns (row indices, scores), best first; ties keep row order.
+    """
+    n, d  = emb.shape
+    top_i = np.full(k, -1, dtype=np.int64)
+    top_s = np.full(k, -np.inf, dtype=np.float32)
+    for i in range(n):
+        s = np.float32(0.0)
+        for j in range(d):
+            s += emb[i, j] * q[j]
+        if s > top_s[k - 1]:
+            pos = k - 1
+            while pos > 0 and top_s[pos - 1] < s:
+                top_s[pos] = top_s[pos - 1]
+                top_i[pos] = top_i[pos - 1]
+                pos -= 1
+            top_s[pos] = s
+            top_i[pos] = i
+    return top_i, top_s
@@ -5,11 +5,31 @@ Handles API calls, role conversion, response validation.
 
 import os
 import re
+import json
 import time
+import random
+import hashlib
+import datetime
+import functools
+import threading
+from collections import OrderedDict
 import google.generativeai as genai
-from components.prompts import SYSTEM_PROMPT, PROMPT_CONFIG
+from google.api_core import exceptions as api_exceptions
+from components.prompts import SYSTEM_PROMPT, PROMPT_CONFIG, estimate_tokens
+
+try:
+    import hyperscan   # optional: multi-pattern DFA scan for the leakage check
+except ImportError:
+    hyperscan = None
 
 LLM_MODEL = PROMPT_CONFIG["model"]
+CONTEXT_CACHE_TTL = 300   # seconds
+CACHE_MIN_TOKENS  = 1024  # smallest prefix the model accepts for explicit context caching
+EXACT_CACHE_SIZE  = 1024  # identical-prompt responses kept in memory
+MAX_QPS           = 4     # process-wide pace for outgoing Gemini requests
+MAX_RETRY_WAIT    = 20    # seconds; a longer server-requested wait fails fast instead
+LEAK_CHECK_TAIL   = 64    # already-checked chars rescanned, so a phrase split across chunks is caught
+REQUEST_TIMEOUT   = 30    # seconds per attempt; a user is waiting on every call
 
 ANSWER_LEAKAGE_PATTERNS = [
     r"\bthe (correct|right) answer is\b",
@@ -19,6 +39,69 @@ ANSWER_LEAKAGE_PATTERNS = [
     r"\bcorrect option is\b",
 ]
 
+# Single case-insensitive alternation, compiled once at import
+_LEAK_RE = re.compile("|".join(f"(?:{p})" for p in ANSWER_LEAKAGE_PATTERNS), re.IGNORECASE)
+
+
+def _compile_leak_db():
+    """Hyperscan database for ANSWER_LEAKAGE_PATTERNS, or None to use _LEAK_RE."""
+    if hyperscan is None:
+        return None
+    try:
+        db = hyperscan.Database()
+        db.compile(
+            expressions=[p.encode() for p in ANSWER_LEAKAGE_PATTERNS],
+            ids=list(range(len(ANSWER_LEAKAGE_PATTERNS))),
+            elements=len(ANSWER_LEAKAGE_PATTERNS),
+            flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH] * len(ANSWER_LEAKAGE_PATTERNS),
+        )
+        return db
+    except Exception:
+        return None
+
+
+_LEAK_DB      = _compile_leak_db()
+_LEAK_DB_LOCK = threading.Lock()   # a Database shares one scratch space; scans must not overlap
+
+
+def _has_leakage(text: str) -> bool:
+    if _LEAK_DB is None:
+        return _LEAK_RE.search(text) is not None
+    matched = []
+
+    def on_match(pattern_id, start, end, flags, context):
+        matched.append(pattern_id)
+        return True   # stop at the first hit
+
+    with _LEAK_DB_LOCK:
+        try:
+            _LEAK_DB.scan(text.encode(), match_event_handler=on_match)
+        except hyperscan.ScanTerminated:
+            pass
+    return bool(matched)
+
+
+_LAST_SPACE_RE  = re.compile(r"\s\S*\Z")   # last whitespace, and the partial word after it
+_FIRST_SPACE_RE = re.compile(r"\s")
+
+
+def _leaks_with_tail(buf: str, text: str) -> bool:
+    """
+    Leakage check for text about to be appended to already-checked buf.
+    Rescans up to LEAK_CHECK_TAIL chars of buf, starting at a word boundary so
+    the cut never creates a false \b. text must end at a word boundary too.
+    """
+    tail = buf[-LEAK_CHECK_TAIL:]
+    if len(buf) > LEAK_CHECK_TAIL:
+        space = _FIRST_SPACE_RE.search(tail)
+        tail  = tail[space.end():] if space else ""
+    return _has_leakage(tail + text)
+
+
+class AnswerLeakage(Exception):
+    """Raised by call_gemini_stream before yielding a chunk that would leak an answer."""
+
+
 LEAKAGE_BLOCK = (
     "I noticed my response may have included assessment-specific content I should not share.\n\n"
     "I can explain **how assessments work** on the platform instead. "
@@ -26,18 +109,31 @@ LEAKAGE_BLOCK = (
 )
 
 
+_configured_key = None
+
+
 def init_gemini():
+    """
+    Configures the Gemini client over gRPC (one persistent, multiplexed
+    HTTP/2 channel). genai.configure() discards existing clients and their
+    connections, so it only runs again when the API key actually changes.
+    """
+    global _configured_key
     api_key = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
     if not api_key:
         raise ValueError(
             "GEMINI_API_KEY not found. Set it in Streamlit Secrets or your .env file.\n"
             "Get your key at: https://aistudio.google.com/app/apikey"
         )
-    genai.configure(api_key=api_key)
+    if api_key == _configured_key:
+        return
+    genai.configure(api_key=api_key, transport="grpc")
+    _configured_key = api_key
+    reset_model()   # models bind the client on first use; drop the one built for the old key
 
 
-def get_model():
-    config = genai.GenerationConfig(
+def _generation_config():
+    return genai.GenerationConfig(
         temperature      = PROMPT_CONFIG["temperature"],
         top_p            = PROMPT_CONFIG["top_p"],
         top_k            = PROMPT_CONFIG["top_k"],
@@ -45,31 +141,190 @@ def get_model():
         candidate_count  = PROMPT_CONFIG["candidate_count"],
         stop_sequences   = PROMPT_CONFIG["stop_sequences"],
     )
+
+
+def get_model(cached_content: str = None):
+    """
+    Returns the Gemini model.
+    With cached_content, the system prompt + KB prefix are replayed from the
+    server-side context cache instead of being resent.
+    """
+    if cached_content:
+        return _cached_model(cached_content)
+    return _default_model()
+
+
+@functools.lru_cache(maxsize=16)
+def _cached_model(cached_content: str):
+    """Model bound to a context cache; memoized so each turn skips the CachedContent.get round trip."""
+    cache = genai.caching.CachedContent.get(cached_content)
+    return genai.GenerativeModel.from_cached_content(
+        cached_content    = cache,
+        generation_config = _generation_config(),
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def _default_model():
+    """Singleton model with the inline system prompt, built on first use."""
     return genai.GenerativeModel(
         model_name        = LLM_MODEL,
-        generation_config = config,
+        generation_config = _generation_config(),
         system_instruction= SYSTEM_PROMPT
     )
 
 
+def reset_model():
+    """Drops the cached models (API key or PROMPT_CONFIG changed)."""
+    _default_model.cache_clear()
+    _cached_model.cache_clear()
+
+
+def create_context_cache(context_block: str):
+    """
+    Stores SYSTEM_PROMPT + the KB context block as a Gemini context cache.
+    Returns the cache name, or None if the prefix is below CACHE_MIN_TOKENS
+    (checked locally, no round trip) or the API rejects it.
+    """
+    if estimate_tokens(SYSTEM_PROMPT + context_block) < CACHE_MIN_TOKENS:
+        return None
+    try:
+        cache = genai.caching.CachedContent.create(
+            model             = LLM_MODEL,
+            system_instruction= SYSTEM_PROMPT,
+            contents          = [{"role": "user", "parts": [context_block]}],
+            ttl               = datetime.timedelta(seconds=CONTEXT_CACHE_TTL),
+        )
+    except Exception:
+        return None
+    with _EXACT_LOCK:
+        _CACHE_CONTENT[cache.name] = hashlib.blake2b(context_block.encode(), digest_size=16).hexdigest()
+        while len(_CACHE_CONTENT) > EXACT_CACHE_SIZE:
+            _CACHE_CONTENT.popitem(last=False)
+    return cache.name
+
+
+def delete_context_cache(name: str):
+    """Deletes a context cache. Expired or missing caches are ignored."""
+    try:
+        genai.caching.CachedContent.get(name).delete()
+    except Exception:
+        pass
+
+
+# Exact-match prompt cache: hash(model + system prompt + messages + cached context) → response
+_EXACT         = OrderedDict()
+_EXACT_LOCK    = threading.Lock()
+_CACHE_CONTENT = OrderedDict()   # context cache name → digest of the KB block it holds
+
+
+def _exact_key(messages: list, cached_content: str = None) -> str:
+    """
+    Keyed on what a context cache holds, not its name: names change every
+    time the cache is recreated (~CONTEXT_CACHE_TTL), the prompt doesn't.
+    """
+    with _EXACT_LOCK:
+        context = _CACHE_CONTENT.get(cached_content, cached_content)
+    payload = json.dumps([LLM_MODEL, SYSTEM_PROMPT, context, messages], sort_keys=True)
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+def _exact_get(key: str):
+    with _EXACT_LOCK:
+        text = _EXACT.get(key)
+        if text is not None:
+            _EXACT.move_to_end(key)
+        return text
+
+
+def _exact_put(key: str, text: str):
+    with _EXACT_LOCK:
+        _EXACT[key] = text
+        _EXACT.move_to_end(key)
+        while len(_EXACT) > EXACT_CACHE_SIZE:
+            _EXACT.popitem(last=False)
+
+
+class _Pacer:
+    """
+    Token bucket shared by every Gemini call in the process, so bursts are
+    spread out client-side instead of being answered with 429s.
+    """
+    def __init__(self, rate: float):
+        self.rate   = rate
+        self.tokens = rate
+        self.last   = time.monotonic()
+        self._lock  = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now         = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate)
+                self.last   = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_pacer = _Pacer(MAX_QPS)
+
+# Errors worth retrying (429 / 503 / 500)
+_RETRYABLE   = (
+    api_exceptions.ResourceExhausted,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.InternalServerError,
+)
+_RETRY_IN_RE = re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE)
+
+
+def _retry_after(e: Exception):
+    """
+    Server-requested wait in seconds, or None.
+    Checked in order: RetryInfo in the gRPC error details, an HTTP
+    Retry-After header, then the "Please retry in Xs" hint in the message.
+    """
+    for detail in getattr(e, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None:
+            return delay.seconds + delay.nanos / 1e9
+    response = getattr(e, "response", None)
+    header   = getattr(response, "headers", {}).get("Retry-After") if response is not None else None
+    if header:
+        try:
+            return float(header)
+        except ValueError:
+            pass
+    match = _RETRY_IN_RE.search(str(e))
+    return float(match.group(1)) if match else None
+
+
+def _backoff(e: Exception, attempt: int):
+    """
+    Seconds to sleep before the next attempt, or None to give up.
+    Honors the server's retry hint; otherwise full-jitter exponential backoff
+    so concurrent clients don't retry in lock-step.
+    """
+    wait = _retry_after(e)
+    if wait is None:
+        return random.uniform(0.5, 2 ** attempt)
+    return wait if wait <= MAX_RETRY_WAIT else None
+
+
 def validate_response(text: str):
     """Post-response safety check for answer leakage."""
-    lower = text.lower()
-    for pattern in ANSWER_LEAKAGE_PATTERNS:
-        if re.search(pattern, lower):
-            return False, LEAKAGE_BLOCK
+    if _has_leakage(text):
+        return False, LEAKAGE_BLOCK
     return True, text
 
 
-def call_gemini(messages: list, retries: int = 2):
+def _split_messages(messages: list):
     """
-    Calls Gemini API.
-    - Converts 'assistant' → 'model' for Gemini compatibility
-    - Sends full conversation history for continuity
-    - Returns (response_text, latency_seconds)
+    Converts 'assistant' → 'model' and splits off the current message.
+    Returns (history, last_message).
     """
-    model = get_model()
-
     # Fix roles: Gemini uses 'user' and 'model' (NOT 'assistant')
     fixed = []
     for msg in messages:
@@ -77,22 +332,109 @@ def call_gemini(messages: list, retries: int = 2):
         fixed.append({"role": role, "parts": msg["parts"]})
 
     # Split into history (all but last) and current message
-    history      = fixed[:-1]
-    last_message = fixed[-1]["parts"][0]
+    return fixed[:-1], fixed[-1]["parts"][0]
+
+
+def call_gemini(
+    messages:       list,
+    retries:        int = 2,
+    cached_content: str = None
+):
+    """
+    Calls Gemini API.
+    - Converts 'assistant' → 'model' for Gemini compatibility
+    - Sends full conversation history for continuity
+    - cached_content: name of a context cache holding the system prompt + KB prefix
+    - Identical prompts are answered from the exact-match cache (latency 0.0)
+    - Returns (response_text, latency_seconds)
+    """
+    key    = _exact_key(messages, cached_content)
+    cached = _exact_get(key)
+    if cached is not None:
+        return cached, 0.0
+
+    model = get_model(cached_content)
+    history, last_message = _split_messages(messages)
 
     for attempt in range(retries + 1):
         try:
+            _pacer.acquire()
             t0       = time.time()
             chat     = model.start_chat(history=history)
-            response = chat.send_message(last_message)
+            response = chat.send_message(
+                last_message, request_options={"timeout": REQUEST_TIMEOUT}
+            )
             latency  = time.time() - t0
 
             _, final_text = validate_response(response.text)
+            _exact_put(key, final_text)
             return final_text, latency
 
-        except Exception as e:
-            err_str = str(e)
-            if attempt < retries and ("429" in err_str or "500" in err_str):
-                time.sleep(2 ** attempt)   # exponential backoff
-                continue
-            raise e
\ No newline at end of file
+        except _RETRYABLE as e:
+            wait = _backoff(e, attempt) if attempt < retries else None
+            if wait is None:
+                raise
+            time.sleep(wait)
+
+
+def call_gemini_stream(
+    messages:       list,
+    retries:        int = 2,
+    cached_content: str = None
+):
+    """
+    Streaming variant of call_gemini: yields text chunks as Gemini generates them.
+    - Retries only before the first chunk has been yielded
+    - Identical prompts replay the cached text as a single chunk
+    - Text is checked for answer leakage before it is yielded; on a hit
+      AnswerLeakage is raised and the leaking text is never shown. A trailing
+      partial word is held back until the next chunk (or the end), so a word
+      split across chunks is never scanned as two.
+    - The caller runs validate_response() on the joined text
+    """
+    key    = _exact_key(messages, cached_content)
+    cached = _exact_get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    model = get_model(cached_content)
+    history, last_message = _split_messages(messages)
+
+    for attempt in range(retries + 1):
+        started = False
+        buf     = ""   # checked and yielded
+        pending = ""   # received, not yet checked: a trailing partial word
+        try:
+            _pacer.acquire()
+            chat     = model.start_chat(history=history)
+            response = chat.send_message(
+                last_message, stream=True, request_options={"timeout": REQUEST_TIMEOUT}
+            )
+            for chunk in response:
+                if chunk.parts:
+                    started  = True
+                    pending += chunk.text
+                    space    = _LAST_SPACE_RE.search(pending)
+                    if space is None:
+                        continue
+                    text, pending = pending[:space.start() + 1], pending[space.start() + 1:]
+                    if _leaks_with_tail(buf, text):
+                        raise AnswerLeakage()
+                    buf += text
+                    yield text
+            if pending:
+                if _leaks_with_tail(buf, pending):
+                    raise AnswerLeakage()
+                buf += pending
+                yield pending
+            _exact_put(key, buf)   # only complete streams are cached
+            return
+
+        except _RETRYABLE as e:
+            if started:
+                raise
+            wait = _backoff(e, attempt) if attempt < retries else None
+            if wait is None:
+                raise
+            time.sleep(wait)
@@ -2,19 +2,119 @@
 logger.py - Anonymized Interaction Logging
 Logs queries, intents, retrieved docs, latency, and safety triggers.
 No PII is stored.
+Entries are queued and written by a background thread, off the request path.
 """
 
 import json
 import os
+import time
+import queue
+import atexit
 import hashlib
+import functools
+import threading
 from datetime import datetime
 
+try:
+    import orjson   # optional: faster JSON serialization
+except ImportError:
+    orjson = None
+
 LOG_PATH = os.path.join(os.path.dirname(__file__), "../logs/interactions.jsonl")
 
+LOG_QUEUE      = queue.SimpleQueue()
+FLUSH_BATCH    = 32     # write as soon as this many entries are pending
+FLUSH_INTERVAL = 0.5    # ...or at least this often (seconds)
+LOG_BUFFER     = 1 << 16
+
+# Tagged on every entry so consumers can tell hash schemes apart
+# (entries without it used truncated SHA-256)
+USER_HASH_ALG  = "blake2b-64"
+
+_log_file  = None             # append handle, opened on first write and kept open
+_file_lock = threading.Lock()  # writer thread and the exit flush share the handle
+_writer    = None              # background writer thread, once started
+_stop      = threading.Event() # set at exit: the writer flushes everything it holds, then returns
 
+
+@functools.lru_cache(maxsize=512)
 def _anonymize_user(session_id: str) -> str:
-    """SHA-256 hash of session ID — no PII stored."""
-    return hashlib.sha256(session_id.encode()).hexdigest()[:16]
+    """BLAKE2b hash of session ID — no PII stored. Memoized: IDs repeat every turn."""
+    return hashlib.blake2b(session_id.encode(), digest_size=8).hexdigest()
+
+
+def _dumps(entry: dict) -> str:
+    if orjson is not None:
+        return orjson.dumps(entry).decode()
+    return json.dumps(entry)
+
+
+def _write_batch(batch: list):
+    """Append a batch of entries to the JSONL log file in one write."""
+    global _log_file
+    try:
+        with _file_lock:
+            if _log_file is None:
+                os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
+                _log_file = open(LOG_PATH, "a", buffering=LOG_BUFFER)
+            _log_file.write("".join(_dumps(entry) + "\n" for entry in batch))
+            _log_file.flush()
+    except Exception:
+        pass
+
+
+def _drain() -> list:
+    batch = []
+    while True:
+        try:
+            batch.append(LOG_QUEUE.get_nowait())
+        except queue.Empty:
+            return batch
+
+
+def _writer_loop():
+    batch    = []
+    deadline = time.time() + FLUSH_INTERVAL
+    while not _stop.is_set():
+        try:
+            batch.append(LOG_QUEUE.get(timeout=max(0.0, deadline - time.time())))
+        except queue.Empty:
+            pass
+        now = time.time()
+        if len(batch) >= FLUSH_BATCH or (batch and now >= deadline):
+            _write_batch(batch)
+            batch = []
+        if now >= deadline:
+            deadline = now + FLUSH_INTERVAL
+    batch += _drain()
+    if batch:
+        _write_batch(batch)
+
+
+def start_log_writer() -> threading.Thread:
+    """Starts the background writer. Call once per process."""
+    global _writer
+    _writer = threading.Thread(target=_writer_loop, name="edubot-log-writer", daemon=True)
+    _writer.start()
+    return _writer
+
+
+@atexit.register
+def _flush_on_exit():
+    """
+    Stops the writer and waits for it: it writes both its in-progress batch
+    and whatever is still queued. Without a writer, drains the queue here.
+    """
+    _stop.set()
+    if _writer is not None and _writer.is_alive():
+        _writer.join(timeout=4 * FLUSH_INTERVAL)
+    else:
+        batch = _drain()
+        if batch:
+            _write_batch(batch)
+    with _file_lock:
+        if _log_file is not None:
+            _log_file.close()
 
 
 def log_interaction(
@@ -24,22 +124,20 @@ def log_interaction(
     retrieved_titles: list,
     latency: float,
     safety_triggered: bool,
-    response_preview: str = ""
+    response_preview: str = "",
+    history_tokens:   int = 0
 ):
-    """Append one log entry to the JSONL log file."""
-    os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
+    """Queue one log entry for the background writer. Never blocks."""
     entry = {
         "timestamp": datetime.utcnow().isoformat() + "Z",
         "user_hash": _anonymize_user(session_id),
+        "user_hash_alg": USER_HASH_ALG,
         "query_length": len(query),                    # No raw query stored (privacy)
         "intent": intent,
         "retrieved_docs": retrieved_titles,
         "latency_seconds": round(latency, 3),
         "safety_triggered": safety_triggered,
-        "response_preview_length": len(response_preview)
+        "response_preview_length": len(response_preview),
+        "history_tokens": history_tokens                # estimated prompt tokens spent on history
     }
-    try:
-        with open(LOG_PATH, "a") as f:
-            f.write(json.dumps(entry) + "\n")
-    except Exception:
-        pass
+    LOG_QUEUE.put_nowait(entry)
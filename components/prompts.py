@@ -3,7 +3,10 @@ prompts.py - Prompt Configuration and Builder
 Uses ALL top-k chunks + full conversation history for context.
 """
 
-from typing import List
+import json
+import hashlib
+import functools
+from typing import List, Tuple
 from components.retriever import RetrievedChunk
 
 SYSTEM_PROMPT = """You are EduBot, a helpful AI assistant for an EdTech online learning platform.
@@ -41,8 +44,22 @@ PROMPT_CONFIG = {
     "stop_sequences":   ["User:", "Human:"],
 }
 
+# Changes whenever the system prompt or generation settings (incl. model) do;
+# persisted answers are namespaced by it
+PROMPT_VERSION = hashlib.blake2b(
+    json.dumps([SYSTEM_PROMPT, PROMPT_CONFIG], sort_keys=True).encode(), digest_size=8
+).hexdigest()
+
 CONFIDENCE_THRESHOLD = 0.20
 
+# Prior turns sent with each question: newest first until the token budget
+# is spent, and never more than the last 6 turns (6 user + 6 assistant)
+HISTORY_TOKEN_BUDGET = 1500
+HISTORY_MAX_MESSAGES = 12
+
+_BAR       = "=" * 70
+_CHUNK_SEP = "\n\n---\n\n"
+
 LOW_CONFIDENCE_RESPONSE = (
     "I want to give you the most accurate answer. Could you clarify what you're looking for?\n\n"
     "Are you asking about:\n"
@@ -54,55 +71,114 @@ LOW_CONFIDENCE_RESPONSE = (
 )
 
 
+def estimate_tokens(text: str) -> int:
+    """Approximate Gemini token count (~4 chars/token), without a count_tokens round trip."""
+    return len(text) // 4 + 1
+
+
+def select_history(chat_history: List[dict]) -> Tuple[List[dict], int]:
+    """
+    Prior turns to send along with the current (last) message of chat_history.
+    Walks back from the newest turn until HISTORY_TOKEN_BUDGET or
+    HISTORY_MAX_MESSAGES is reached; uses a turn's cached "token_count" when set.
+    Returns (turns oldest-first, their estimated token total).
+    """
+    selected, used = [], 0
+    for turn in reversed(chat_history[-(HISTORY_MAX_MESSAGES + 1):-1]):
+        tokens = turn.get("token_count") or estimate_tokens(turn["content"])
+        if used + tokens > HISTORY_TOKEN_BUDGET:
+            break
+        selected.append((turn, tokens))
+        used += tokens
+
+    # Start on a user turn, never a dangling model reply
+    if selected and selected[-1][0]["role"] == "assistant":
+        used -= selected.pop()[1]
+    return [turn for turn, _ in reversed(selected)], used
+
+
+@functools.lru_cache(maxsize=64)
+def _preamble(n_chunks: int, top_k: int) -> Tuple[str, str]:
+    """
+    Static prompt text for one (chunk count, Top-K) pair, formatted once:
+    (context header, instructions footer). Only chunk bodies and the
+    user question are formatted per turn.
+    """
+    header = (
+        f"KNOWLEDGE BASE CONTEXT — {n_chunks} chunks retrieved (Top-K={top_k}):\n"
+        f"{_BAR}\n"
+    )
+    instructions = (
+        f"INSTRUCTIONS:\n"
+        f"- Synthesize ALL {n_chunks} chunks above into one complete answer.\n"
+        f"- If chunks cover different aspects of the topic, combine them.\n"
+        f"- Be specific — reference platform feature names mentioned in chunks.\n"
+        f"- NEVER provide assessment answers or solve academic questions.\n"
+        f"- Maintain context from the conversation history below."
+    )
+    return header, instructions
+
+
+@functools.lru_cache(maxsize=2048)
+def _fmt_chunk(category: str, title: str, score: str, content: str) -> str:
+    """Chunk section after its "[CHUNK i/n | " position label; the same KB chunks recur across queries."""
+    return (
+        f"Category: {category.upper()} | "
+        f"Title: {title} | "
+        f"Relevance: {score}]\n"
+        f"{content}"
+    )
+
+
+def build_context_block(
+    retrieved_chunks: List[RetrievedChunk],
+    top_k:            int = 4
+) -> str:
+    """
+    Builds the KB context block from ALL retrieved chunks.
+    This is the stable prefix that can be stored in a Gemini context cache.
+    """
+    n = len(retrieved_chunks)
+    if retrieved_chunks:
+        context_block = _CHUNK_SEP.join(
+            f"[CHUNK {i}/{n} | "
+            + _fmt_chunk(chunk.category, chunk.title, f"{chunk.score:.3f}", chunk.content)
+            for i, chunk in enumerate(retrieved_chunks, 1)
+        )
+    else:
+        context_block = "No relevant knowledge base articles found for this query."
+
+    header, _ = _preamble(n, top_k)
+    return f"{header}{context_block}\n{_BAR}"
+
+
 def build_prompt(
     user_query:       str,
     retrieved_chunks: List[RetrievedChunk],
     chat_history:     List[dict],
     intent:           str,
-    top_k:            int = 4
+    top_k:            int  = 4,
+    include_context:  bool = True
 ) -> List[dict]:
     """
     Builds the Gemini messages list.
     - Uses ALL retrieved_chunks (exactly top_k of them)
-    - Includes last 6 turns of conversation for continuity
+    - Includes recent conversation within HISTORY_TOKEN_BUDGET (see select_history)
     - Converts 'assistant' role to 'model' for Gemini API
+    - include_context=False leaves the KB block out of the user message
+      (it is already held in a Gemini context cache)
     """
 
-    # ── Build RAG context from ALL chunks ──
-    if retrieved_chunks:
-        chunk_sections = []
-        for i, chunk in enumerate(retrieved_chunks, 1):
-            chunk_sections.append(
-                f"[CHUNK {i}/{len(retrieved_chunks)} | "
-                f"Category: {chunk.category.upper()} | "
-                f"Title: {chunk.title} | "
-                f"Relevance: {chunk.score:.3f}]\n"
-                f"{chunk.content}"
-            )
-        context_block = "\n\n---\n\n".join(chunk_sections)
-    else:
-        context_block = "No relevant knowledge base articles found for this query."
-
     # ── Build augmented user message ──
-    augmented_message = (
-        f"KNOWLEDGE BASE CONTEXT — {len(retrieved_chunks)} chunks retrieved (Top-K={top_k}):\n"
-        f"{'='*70}\n"
-        f"{context_block}\n"
-        f"{'='*70}\n\n"
-        f"USER QUESTION: {user_query}\n\n"
-        f"INSTRUCTIONS:\n"
-        f"- Synthesize ALL {len(retrieved_chunks)} chunks above into one complete answer.\n"
-        f"- If chunks cover different aspects of the topic, combine them.\n"
-        f"- Be specific — reference platform feature names mentioned in chunks.\n"
-        f"- NEVER provide assessment answers or solve academic questions.\n"
-        f"- Maintain context from the conversation history below."
+    _, instructions = _preamble(len(retrieved_chunks), top_k)
+    context_prefix = (
+        f"{build_context_block(retrieved_chunks, top_k)}\n\n" if include_context else ""
     )
+    augmented_message = f"{context_prefix}USER QUESTION: {user_query}\n\n{instructions}"
 
     # ── Build messages list with conversation history ──
-    # Keep last 6 turns (= 12 messages: 6 user + 6 assistant)
-    # Exclude the very last user message (we'll add the augmented version instead)
-    history_for_context = chat_history[:-1]   # remove last user msg
-    recent_history = history_for_context[-12:] if len(history_for_context) > 12 else history_for_context
+    # Excludes the very last user message (we'll add the augmented version instead)
+    recent_history, _ = select_history(chat_history)
 
     messages = []
     for turn in recent_history:
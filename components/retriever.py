@@ -1,22 +1,79 @@
 """
-retriever.py - RAG Retriever using FAISS + sentence-transformers
+retriever.py - RAG Retriever using sentence-transformers + exact NumPy search
 """
 
 import json
 import os
+import time
+import queue
+import hashlib
+import platform
+import threading
+import importlib.util
 import numpy as np
-import faiss
+import torch
 from sentence_transformers import SentenceTransformer
-from dataclasses import dataclass
-from typing import List, Optional
-from collections import Counter
+from typing import Callable, List, NamedTuple, Optional, Tuple
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+
+try:
+    from components._kernels import dot_topk   # optional: fused Numba dot + top-k
+except ImportError:
+    dot_topk = None
 
 KB_PATH    = os.path.join(os.path.dirname(__file__), "../data/knowledge_base.json")
+CACHE_DIR  = os.path.join(os.path.dirname(__file__), "../.cache")
 EMBED_MODEL = "all-MiniLM-L6-v2"
 
+# Reduced-precision embedder: fp16 weights on GPU, int8 dynamic quantization on CPU
+QUANTIZE_EMBEDDER = True
+
+# On CPU, run the int8 embedder under ONNX Runtime when optimum[onnxruntime] is
+# installed (fused graph + int8 GEMM kernels); otherwise quantized PyTorch.
+# Checked by spec only: importing onnxruntime/optimum up front would slow boot.
+# Switched to "torch" if the ONNX model then fails to load; vectors are cached
+# per backend, so the KB is re-embedded rather than mixed (see KBRetriever.model).
+EMBED_BACKEND = (
+    "onnx"
+    if QUANTIZE_EMBEDDER
+    and importlib.util.find_spec("onnxruntime") is not None
+    and importlib.util.find_spec("optimum") is not None
+    and not torch.cuda.is_available()
+    else "torch"
+)
+# Pre-quantized int8 exports published with the model
+ONNX_INT8_FILE = (
+    "onnx/model_qint8_arm64.onnx"
+    if platform.machine().lower() in ("arm64", "aarch64")
+    else "onnx/model_quint8_avx2.onnx"
+)
+
+# Text embedded per article (richer embeddings: title + tags + content)
+EMBED_TEXT_TEMPLATE = "{title}. Tags: {tags}. {content}"
+
+# LRU of candidate pools keyed on (normalized query, pool size)
+RESULT_CACHE_SIZE = 256
+
+# Semantic tier behind it: a query embedding within SEMANTIC_THRESHOLD cosine of
+# one of the last SEMANTIC_CACHE_SIZE searched queries reuses that query's pool
+SEMANTIC_CACHE_SIZE = 512
+SEMANTIC_THRESHOLD  = 0.95
+
+VALID_CATEGORIES = frozenset({"course", "assessment", "certification", "progress"})
+_CAT_TO_INT      = {"course": 0, "assessment": 1, "certification": 2, "progress": 3}   # -1: other
+
+# A category preference is served from that category's own rows when its best
+# match scores at least this; otherwise the pooled soft preference is used
+CATEGORY_MIN_SCORE = 0.20
 
-@dataclass
-class RetrievedChunk:
+# Query micro-batching: concurrent encode requests arriving within
+# EMBED_BATCH_WAIT seconds share one forward pass (up to EMBED_BATCH_MAX texts)
+EMBED_BATCH_WAIT = 0.005
+EMBED_BATCH_MAX  = 32
+
+
+class RetrievedChunk(NamedTuple):
     id:       str
     title:    str
     category: str
@@ -25,36 +82,427 @@ class RetrievedChunk:
     tags:     List[str]
 
 
+class CandidatePool(NamedTuple):
+    """Search hits as parallel arrays, best first; chunks are built only for final results."""
+    indices:   np.ndarray   # article row numbers
+    scores:    np.ndarray
+    query_vec: np.ndarray   # kept so a category preference can rescore that category alone
+
+
+def _load_embedder() -> SentenceTransformer:
+    global EMBED_BACKEND
+    if EMBED_BACKEND == "onnx":
+        try:
+            return SentenceTransformer(
+                EMBED_MODEL, backend="onnx", model_kwargs={"file_name": ONNX_INT8_FILE}
+            )
+        except Exception as e:   # missing export, unsupported platform, ...
+            print(f"[Retriever] ONNX embedder unavailable ({e}); using PyTorch")
+            EMBED_BACKEND = "torch"
+    model = SentenceTransformer(EMBED_MODEL)
+    if not QUANTIZE_EMBEDDER:
+        return model
+    if torch.cuda.is_available():
+        return model.half()
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _kb_fingerprint(kb_bytes: bytes) -> str:
+    """Hash of the KB file contents plus everything that changes its vectors (embedder, quantization)."""
+    h = hashlib.sha256(kb_bytes)
+    h.update(f"{EMBED_MODEL}:{QUANTIZE_EMBEDDER}:{EMBED_BACKEND}".encode())
+    return h.hexdigest()[:16]
+
+
+def _embeddings_key(titles, tags, contents) -> str:
+    """
+    Hash of exactly what gets embedded (title + tags + content per article, and
+    the template joining them) plus the embedder, so edits to other KB fields or
+    file formatting reuse the vectors. Hashes the fields directly: the embedding
+    texts are only built on a cache miss.
+    """
+    h = hashlib.blake2b(digest_size=8)
+    for title, article_tags, content in zip(titles, tags, contents):
+        h.update(title.encode())
+        h.update(b"\0")
+        h.update("\x1f".join(article_tags).encode())
+        h.update(b"\0")
+        h.update(content.encode())
+        h.update(b"\0")
+    h.update(f"{EMBED_TEXT_TEMPLATE}:{EMBED_MODEL}:{QUANTIZE_EMBEDDER}:{EMBED_BACKEND}".encode())
+    return h.hexdigest()
+
+
+def _write_embeddings(embeddings: np.ndarray, path: str):
+    """Atomic .npy write, so concurrent workers never read a partial file."""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, embeddings)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"[Retriever] Could not persist embeddings: {e}")
+
+
+class EmbedBatcher:
+    """
+    Background worker that coalesces concurrent query encodes into
+    batched encode_fn calls. encode() returns a Future of one
+    normalized float32 vector; identical texts already queued or being
+    encoded share that Future instead of taking another batch slot.
+    """
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], np.ndarray],
+        max_batch: int   = EMBED_BATCH_MAX,
+        max_wait:  float = EMBED_BATCH_WAIT
+    ):
+        self.encode_fn = encode_fn
+        self.max_batch = max_batch
+        self.max_wait  = max_wait
+        self._queue    = queue.Queue()
+        self._inflight = {}                 # text -> Future, until its batch finishes
+        self._lock     = threading.Lock()
+        threading.Thread(target=self._run, name="embed-batcher", daemon=True).start()
+
+    def encode(self, text: str) -> Future:
+        with self._lock:
+            future = self._inflight.get(text)
+            if future is not None:
+                return future
+            future = self._inflight[text] = Future()
+        self._queue.put((text, future))
+        return future
+
+    def _collect(self) -> list:
+        """Blocks for the first request, then gathers more until max_wait or max_batch."""
+        items    = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            try:
+                vecs = self.encode_fn([text for text, _ in items])
+            except Exception as e:
+                self._release(items)
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            self._release(items)
+            for (_, future), vec in zip(items, vecs):
+                future.set_result(vec)
+
+    def _release(self, items: list):
+        """Later requests for these texts start a new encode."""
+        with self._lock:
+            for text, _ in items:
+                self._inflight.pop(text, None)
+
+
 class KBRetriever:
     def __init__(self):
-        self.model    = SentenceTransformer(EMBED_MODEL)
-        self.articles = []
-        self.index    = None
+        self._model      = None
+        self._model_lock = threading.Lock()
+        self.batcher     = EmbedBatcher(self._encode_batch)
+        self.size        = 0
+        self.embeddings  = None
+        self.dim         = 0
+        self.kb_backend  = None   # EMBED_BACKEND the KB vectors were computed with
+        self._cache      = OrderedDict()
+        self._cache_lock = threading.Lock()
         self._load_and_index()
 
+    @property
+    def model(self) -> SentenceTransformer:
+        """Embedder, loaded on first use: a warm boot only needs the cached KB vectors."""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = _load_embedder()
+                    if self.kb_backend not in (None, EMBED_BACKEND):
+                        # ONNX fell back to PyTorch after the KB vectors were loaded
+                        # from the ONNX cache: re-embed so queries and KB match
+                        self._load_and_index()
+        return self._model
+
     def _load_and_index(self):
-        with open(KB_PATH, "r") as f:
-            self.articles = json.load(f)
+        with open(KB_PATH, "rb") as f:
+            kb_bytes = f.read()
+        articles = json.loads(kb_bytes)
+
+        # Column arrays indexed like self.embeddings rows; the parsed dicts are not kept
+        self.size       = len(articles)
+        self.ids        = np.array([a["id"] for a in articles], dtype=object)
+        self.titles     = np.array([a["title"] for a in articles], dtype=object)
+        self.categories = np.array([a["category"] for a in articles], dtype=object)
+        self.contents   = np.array([a["content"] for a in articles], dtype=object)
+        self.tags       = [a.get("tags", []) for a in articles]
+        self.cat_ids    = np.array(
+            [_CAT_TO_INT.get(a["category"], -1) for a in articles], dtype=np.int8
+        )
+
+        # (N, d) float32 matrix of normalized vectors; search is a matmul against it
+        self.kb_backend = None
+        self.embeddings = self._load_embeddings()
+        self.dim        = self.embeddings.shape[1]
+        self.kb_backend = EMBED_BACKEND
+
+        # kb_version changes whenever the KB contents or its vectors change
+        # (after loading: the backend is final by then)
+        self.kb_version = _kb_fingerprint(kb_bytes)
 
-        # Richer embeddings: title + tags + content
-        texts = []
-        for a in self.articles:
-            tags_str = ", ".join(a.get("tags", []))
-            texts.append(f"{a['title']}. Tags: {tags_str}. {a['content']}")
+        # Per-category row numbers and contiguous embedding submatrices
+        self.cat_rows = {}
+        self.cat_embs = {}
+        for cat, cat_id in _CAT_TO_INT.items():
+            rows               = np.flatnonzero(self.cat_ids == cat_id)
+            self.cat_rows[cat] = rows
+            self.cat_embs[cat] = np.ascontiguousarray(self.embeddings[rows])
 
+        self.cache_clear()
+        print(f"[Retriever] Index ready. {self.size} articles, dim={self.dim}")
+
+    def _load_embeddings(self) -> np.ndarray:
+        """
+        Article embeddings as a C-contiguous float32 (N, d) matrix, memory-mapped
+        from the .npy cache or computed and saved. Cast once here so the search
+        matmul never converts or copies it.
+        """
+        embeddings = self._read_embeddings(self._embeddings_path())
+        if embeddings is not None:
+            return embeddings
+
+        # Loading the model may fall back from ONNX to PyTorch, which changes the key
+        model      = self.model
+        embed_path = self._embeddings_path()
+        embeddings = self._read_embeddings(embed_path)
+        if embeddings is not None:
+            return embeddings
+
+        texts = [
+            EMBED_TEXT_TEMPLATE.format(title=title, tags=", ".join(tags), content=content)
+            for title, tags, content in zip(self.titles, self.tags, self.contents)
+        ]
         print(f"[Retriever] Embedding {len(texts)} articles...")
-        embeddings = self.model.encode(
+        embeddings = np.ascontiguousarray(model.encode(
             texts,
+            convert_to_numpy=True,
             normalize_embeddings=True,
             show_progress_bar=False,
-            batch_size=32
+            batch_size=64
+        ), dtype=np.float32)
+        _write_embeddings(embeddings, embed_path)
+        return embeddings
+
+    def _embeddings_path(self) -> str:
+        key = _embeddings_key(self.titles, self.tags, self.contents)
+        return os.path.join(CACHE_DIR, f"kb_emb_{key}_{EMBED_MODEL.replace('/', '_')}.npy")
+
+    def _read_embeddings(self, embed_path: str) -> Optional[np.ndarray]:
+        """Memory-mapped cached vectors, or None if missing or not usable as-is."""
+        if not os.path.exists(embed_path):
+            return None
+        try:
+            embeddings = np.load(embed_path, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        if (embeddings.shape[0] == self.size
+                and embeddings.dtype == np.float32 and embeddings.flags.c_contiguous):
+            print(f"[Retriever] Loaded embeddings from {os.path.basename(embed_path)}")
+            return embeddings
+        return None
+
+    def cache_clear(self):
+        """Drops all cached candidate pools (called on every KB reload)."""
+        with self._cache_lock:
+            self._cache.clear()
+            # Ring buffer of (query vector, pool size, pool); unused rows are zero vectors
+            self._sem_vecs  = np.zeros((SEMANTIC_CACHE_SIZE, self.dim), dtype=np.float32)
+            self._sem_sizes = np.zeros(SEMANTIC_CACHE_SIZE, dtype=np.int32)
+            self._sem_pools = [None] * SEMANTIC_CACHE_SIZE
+            self._sem_next  = 0
+
+    def _semantic_lookup(self, query_vecs: np.ndarray, pool: int) -> List[Optional[CandidatePool]]:
+        """
+        Pools of near-duplicate past queries (searched with >= pool candidates), else None.
+        A hit carries the new query's own vector, not the neighbour's. Holds _cache_lock.
+        """
+        sims = self._sem_vecs @ query_vecs.T          # (SEMANTIC_CACHE_SIZE, n)
+        sims[self._sem_sizes < pool] = -1.0
+        best = sims.argmax(axis=0)
+        hits = []
+        for j, row in enumerate(best):
+            if sims[row, j] > SEMANTIC_THRESHOLD:
+                p = self._sem_pools[row]
+                hits.append(CandidatePool(p.indices[:pool], p.scores[:pool], query_vecs[j]))
+            else:
+                hits.append(None)
+        return hits
+
+    def _semantic_store(self, query_vec: np.ndarray, pool: int, candidates: CandidatePool):
+        """Holds _cache_lock; overwrites the oldest entry once full."""
+        row = self._sem_next
+        self._sem_vecs[row]  = query_vec
+        self._sem_sizes[row] = pool
+        self._sem_pools[row] = candidates
+        self._sem_next       = (row + 1) % SEMANTIC_CACHE_SIZE
+
+    @staticmethod
+    def _pool_size(top_k: int, filtered: bool = True) -> int:
+        """
+        Candidates to fetch: 6x top_k (min 20) when a category preference may
+        reorder them, otherwise just top_k.
+        """
+        return max(top_k * 6, 20) if filtered else top_k
+
+    def _cached_pools(self, queries: List[str], pool: int) -> List[CandidatePool]:
+        """
+        Candidate pools for each query, served from the LRU where possible.
+        Misses are encoded together; those with no near-duplicate in the
+        semantic tier are searched together in one batch.
+        """
+        keys = [(q.strip().lower(), pool) for q in queries]
+        with self._cache_lock:
+            pools = [self._cache.get(k) for k in keys]
+            for k, p in zip(keys, pools):
+                if p is not None:
+                    self._cache.move_to_end(k)
+
+        missing = [i for i, p in enumerate(pools) if p is None]
+        if missing:
+            vecs = self.encode([queries[i] for i in missing])
+            with self._cache_lock:
+                found = self._semantic_lookup(vecs, pool)
+            unseen = [j for j, p in enumerate(found) if p is None]
+            fresh  = self._search(vecs[unseen], pool) if unseen else []
+            with self._cache_lock:
+                for j, candidates in zip(unseen, fresh):
+                    found[j] = candidates
+                    self._semantic_store(vecs[j], pool, candidates)
+                for i, candidates in zip(missing, found):
+                    pools[i] = candidates
+                    self._cache[keys[i]] = candidates
+                    self._cache.move_to_end(keys[i])
+                while len(self._cache) > RESULT_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+        return pools
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        # Already float32 from the embedder; copy=False makes the cast a no-op
+        return self.model.encode(
+            texts, convert_to_numpy=True, normalize_embeddings=True
+        ).astype(np.float32, copy=False)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Embeds query texts as normalized float32 vectors, shape (n, d).
+        Goes through the micro-batcher, so concurrent sessions share forward passes.
+        """
+        futures = [self.batcher.encode(t) for t in texts]
+        return np.stack([f.result() for f in futures])
+
+    def _search(self, query_vecs: np.ndarray, pool: int) -> List[CandidatePool]:
+        """
+        Exact cosine search for an (nq, d) query matrix: one matmul against
+        the KB embeddings, then an argpartition top-`pool` per row.
+        Returns the top `pool` candidates for each query row, best first.
+        With numba installed, each row runs through the fused dot_topk kernel instead.
+        """
+        if dot_topk is not None:
+            embeddings = np.asarray(self.embeddings)   # plain ndarray view of the mmap
+            pool       = min(pool, embeddings.shape[0])
+            return [
+                CandidatePool(*dot_topk(embeddings, query_vec, pool), query_vec)
+                for query_vec in query_vecs
+            ]
+
+        scores = query_vecs @ self.embeddings.T   # (nq, N)
+        pool   = min(pool, scores.shape[1])
+        if pool < scores.shape[1]:
+            indices = np.argpartition(-scores, pool - 1, axis=1)[:, :pool]
+        else:
+            indices = np.tile(np.arange(pool), (scores.shape[0], 1))
+        top    = np.take_along_axis(scores, indices, axis=1)
+        order  = np.argsort(-top, axis=1, kind="stable")
+        return [
+            CandidatePool(row_indices[row_order], row_scores[row_order], query_vec)
+            for row_indices, row_scores, row_order, query_vec in zip(indices, top, order, query_vecs)
+        ]
+
+    def _search_category(
+        self,
+        query_vec: np.ndarray,
+        category:  str,
+        top_k:     int
+    ) -> Optional[List[RetrievedChunk]]:
+        """
+        Top_k chunks scored against the category's submatrix only, or None when
+        the category has fewer than top_k articles or its best match is below
+        CATEGORY_MIN_SCORE.
+        """
+        rows = self.cat_rows[category]
+        if len(rows) < top_k:
+            return None
+        if dot_topk is not None:
+            top, top_scores = dot_topk(self.cat_embs[category], query_vec, top_k)
+        else:
+            scores     = self.cat_embs[category] @ query_vec
+            top        = np.argpartition(-scores, top_k - 1)[:top_k] if top_k < len(rows) else np.arange(len(rows))
+            top        = top[np.argsort(-scores[top], kind="stable")]
+            top_scores = scores[top]
+        if top_scores[0] < CATEGORY_MIN_SCORE:
+            return None
+        return [self._chunk(rows[i], s) for i, s in zip(top, top_scores)]
+
+    def _chunk(self, idx: int, score: float) -> RetrievedChunk:
+        return RetrievedChunk(
+            id=self.ids[idx], title=self.titles[idx], category=self.categories[idx],
+            content=self.contents[idx], score=float(score), tags=self.tags[idx]
         )
-        self.embeddings = embeddings.astype(np.float32)
 
-        dim        = self.embeddings.shape[1]
-        self.index = faiss.IndexFlatIP(dim)   # cosine on normalized vectors
-        self.index.add(self.embeddings)
-        print(f"[Retriever] Index ready. {len(texts)} articles, dim={dim}")
+    def _select(
+        self,
+        candidates:      CandidatePool,
+        category_filter: Optional[str],
+        top_k:           int
+    ) -> List[RetrievedChunk]:
+        """
+        Picks EXACTLY top_k chunks from a candidate pool.
+        With a category preference, the category's own rows are searched
+        first; if that is not confident (see _search_category), falls back to
+        a soft preference: matching categories from the pool, with remaining
+        slots filled by the best cross-category results.
+        """
+        indices, scores = candidates.indices, candidates.scores
+        if category_filter in VALID_CATEGORIES:
+            chunks = self._search_category(candidates.query_vec, category_filter, top_k)
+            if chunks is not None:
+                return chunks
+
+            # One mask over the pool: the first n_pref matches plus the first
+            # (top_k - n_pref) others. The pool is sorted best first, so the kept
+            # positions already come out in score order — no final sort.
+            match  = self.cat_ids[indices] == _CAT_TO_INT[category_filter]
+            n_pref = min(top_k, int(np.count_nonzero(match)))
+            keep   = np.where(match, np.cumsum(match) <= n_pref, np.cumsum(~match) <= top_k - n_pref)
+            picked = np.flatnonzero(keep)
+        else:
+            picked = np.arange(min(top_k, len(indices)))
+
+        # Guards the no-sort invariant above; stripped under python -O
+        assert np.all(np.diff(scores[picked]) <= 0), "candidate pool not sorted best first"
+        return [self._chunk(indices[i], scores[i]) for i in picked]   # ALWAYS exactly top_k
 
     def retrieve(
         self,
@@ -62,55 +510,100 @@ class KBRetriever:
         category_filter: Optional[str] = None,
         top_k:           int           = 4
     ) -> List[RetrievedChunk]:
+        """Returns EXACTLY top_k chunks ranked by cosine similarity."""
+        return self.retrieve_many([query], [category_filter], top_k)[0]
+
+    def search_candidates(self, query: str, top_k: int = 4) -> CandidatePool:
         """
-        Returns EXACTLY top_k chunks ranked by cosine similarity.
-        Soft category preference: prefers matching category but fills
-        remaining slots with best cross-category results.
+        Encode + search only, independent of intent.
+        Rank the returned pool later with rank_candidates().
         """
-        query_vec = self.model.encode(
-            [query], normalize_embeddings=True
-        ).astype(np.float32)
+        return self._cached_pools([query], self._pool_size(top_k))[0]
 
-        # Fetch a large candidate pool (6x top_k, min 20)
-        pool = min(max(top_k * 6, 20), len(self.articles))
-        scores, indices = self.index.search(query_vec, pool)
-
-        candidates = []
-        for score, idx in zip(scores[0], indices[0]):
-            if idx < 0:
-                continue
-            a = self.articles[idx]
-            candidates.append(RetrievedChunk(
-                id=a["id"], title=a["title"], category=a["category"],
-                content=a["content"], score=float(score), tags=a.get("tags", [])
-            ))
-
-        valid_cats = {"course", "assessment", "certification", "progress"}
+    def rank_candidates(
+        self,
+        candidates:      CandidatePool,
+        category_filter: Optional[str] = None,
+        top_k:           int           = 4
+    ) -> Tuple[List[RetrievedChunk], List[RetrievedChunk]]:
+        """
+        Two rankings of the same candidate pool: (category-preferred, unfiltered).
+        The unfiltered ranking is the fallback when the category-preferred one
+        is low-confidence.
+        """
+        return (
+            self._select(candidates, category_filter, top_k),
+            self._select(candidates, None, top_k),
+        )
 
-        if category_filter and category_filter in valid_cats:
-            preferred = [c for c in candidates if c.category == category_filter]
-            others    = [c for c in candidates if c.category != category_filter]
+    def retrieve_with_fallback(
+        self,
+        query:           str,
+        category_filter: Optional[str] = None,
+        top_k:           int           = 4
+    ) -> Tuple[List[RetrievedChunk], List[RetrievedChunk]]:
+        """One encode + one search, ranked both ways (see rank_candidates)."""
+        return self.rank_candidates(self.search_candidates(query, top_k), category_filter, top_k)
 
-            if len(preferred) >= top_k:
-                result = preferred[:top_k]
-            else:
-                result = preferred + others[: top_k - len(preferred)]
-        else:
-            result = candidates[:top_k]
+    def retrieve_precomputed(
+        self,
+        query_vec:       np.ndarray,
+        category_filter: Optional[str] = None,
+        top_k:           int           = 4
+    ) -> Tuple[List[RetrievedChunk], List[RetrievedChunk]]:
+        """Same as retrieve_with_fallback, for a query already embedded with encode()."""
+        candidates = self._search(query_vec.reshape(1, -1), self._pool_size(top_k))[0]
+        return self.rank_candidates(candidates, category_filter, top_k)
 
-        # Final sort by score
-        result = sorted(result, key=lambda x: x.score, reverse=True)
-        return result[:top_k]   # ALWAYS exactly top_k
+    def retrieve_many(
+        self,
+        queries:          List[str],
+        category_filters: Optional[List[Optional[str]]] = None,
+        top_k:            int                           = 4
+    ) -> List[List[RetrievedChunk]]:
+        """Batched retrieve: one encode call and one matmul search for all queries."""
+        if category_filters is None:
+            category_filters = [None] * len(queries)
+        # Wide pool only if some query actually has a category preference
+        filtered = any(c in VALID_CATEGORIES for c in category_filters)
+        pools    = self._cached_pools(queries, self._pool_size(top_k, filtered))
+        return [
+            self._select(candidates, category_filter, top_k)
+            for candidates, category_filter in zip(pools, category_filters)
+        ]
 
     def get_stats(self) -> dict:
-        cats = Counter(a["category"] for a in self.articles)
-        return {"total_articles": len(self.articles), "by_category": dict(cats)}
+        cats = Counter(self.categories.tolist())
+        return {"total_articles": self.size, "by_category": dict(cats)}
 
 
 _retriever_instance = None
+_retriever_lock     = threading.Lock()
 
 def get_retriever() -> KBRetriever:
+    """Shared retriever. Concurrent first callers wait for a single build."""
     global _retriever_instance
     if _retriever_instance is None:
-        _retriever_instance = KBRetriever()
-    return _retriever_instance
\ No newline at end of file
+        with _retriever_lock:
+            if _retriever_instance is None:
+                _retriever_instance = KBRetriever()
+    return _retriever_instance
+
+
+def retriever_ready() -> bool:
+    return _retriever_instance is not None
+
+
+def _warm():
+    retriever = get_retriever()
+    # Load the (lazy) embedder and run one forward pass, so one-time kernel/allocator
+    # setup happens here rather than on the first user query. Straight to
+    # _encode_batch: a warmup query must not land in the result caches.
+    retriever._encode_batch(["warmup query"])
+
+
+def warm_retriever() -> threading.Thread:
+    """Builds the retriever in a background thread, off the first request's path."""
+    thread = threading.Thread(target=_warm, name="retriever-warmup", daemon=True)
+    thread.start()
+    return thread
\ No newline at end of file
@@ -4,6 +4,7 @@ Blocks any query that attempts to get assessment answers.
 """
 
 import re
+import functools
 
 # --- Blocked patterns (assessment-solving intent) ---
 BLOCKED_PATTERNS = [
@@ -19,6 +20,31 @@ BLOCKED_PATTERNS = [
     r"\bcheat\b",
 ]
 
+# One case-insensitive alternation, compiled once: a single scan of the
+# query instead of 10, and no lowercased copy of it
+_BLOCKED_RE = re.compile("|".join(f"(?:{p})" for p in BLOCKED_PATTERNS), re.IGNORECASE)
+
+# Intent keywords, checked in priority order (first matching category wins).
+# Matching is by substring, e.g. "certif" also matches "certification".
+INTENT_KEYWORDS = [
+    ("course",        ["course", "enroll", "module", "lesson", "video", "lecture", "forum", "refund", "language", "subtitle", "note", "bookmark", "support"]),
+    ("assessment",    ["quiz", "exam", "assessment", "assignment", "grade", "score", "pass", "fail", "attempt", "submit", "proctored", "feedback", "plagiarism"]),
+    ("certification", ["certificate", "certif", "specialization", "verify", "download", "share", "employer", "renewal", "expiry", "re-enroll"]),
+    ("progress",      ["progress", "completion", "streak", "activity", "dashboard", "sync", "percent", "log", "gradebook", "notification"]),
+]
+
+# All keywords in one pass. The lookahead reports a match at every position,
+# so overlapping keywords ("re-enroll" / "enroll") are all seen; alternatives
+# are in priority order, so each position yields its highest-priority keyword.
+# Each keyword is its own group and the rank is read from match.lastindex, never
+# from the matched text. Case-insensitive like _BLOCKED_RE, but ASCII-only, so it
+# folds case exactly as str.lower() did for these keywords ("ſ" is not "s").
+_GROUP_RANK = [None] + [_rank for _rank, (_, _words) in enumerate(INTENT_KEYWORDS) for _ in _words]
+_INTENT_RE  = re.compile(
+    "(?=(?:" + "|".join(f"({re.escape(w)})" for _, words in INTENT_KEYWORDS for w in words) + "))",
+    re.IGNORECASE | re.ASCII
+)
+
 SAFE_RESPONSE = (
     "I'm here to help you understand how the platform works — "
     "but I'm not able to provide answers to assessments, quizzes, or exam questions. "
@@ -30,35 +56,28 @@ SAFE_RESPONSE = (
     "Would you like help with any of those? 😊"
 )
 
+@functools.lru_cache(maxsize=1024)
 def classify_intent(query: str) -> str:
     """
     Returns one of: course | assessment | certification | progress | blocked | general
+    Pure function of the query, so repeats (reruns, precompute) come from the LRU.
     """
-    q = query.lower()
-
     # Safety check first
-    if is_blocked(q):
+    if is_blocked(query):
         return "blocked"
 
-    if any(w in q for w in ["course", "enroll", "module", "lesson", "video", "lecture", "forum", "refund", "language", "subtitle", "note", "bookmark", "support"]):
-        return "course"
-    if any(w in q for w in ["quiz", "exam", "assessment", "assignment", "grade", "score", "pass", "fail", "attempt", "submit", "proctored", "feedback", "plagiarism"]):
-        return "assessment"
-    if any(w in q for w in ["certificate", "certif", "specialization", "verify", "download", "share", "employer", "renewal", "expiry", "re-enroll"]):
-        return "certification"
-    if any(w in q for w in ["progress", "completion", "streak", "activity", "dashboard", "sync", "percent", "log", "gradebook", "notification"]):
-        return "progress"
+    best = len(INTENT_KEYWORDS)
+    for match in _INTENT_RE.finditer(query):
+        best = min(best, _GROUP_RANK[match.lastindex])
+        if best == 0:
+            break
 
-    return "general"
+    return INTENT_KEYWORDS[best][0] if best < len(INTENT_KEYWORDS) else "general"
 
 
 def is_blocked(query: str) -> bool:
     """Returns True if the query is trying to get assessment answers."""
-    q = query.lower()
-    for pattern in BLOCKED_PATTERNS:
-        if re.search(pattern, q):
-            return True
-    return False
+    return _BLOCKED_RE.search(query) is not None
 
 
 def get_safe_response() -> str:
@@ -0,0 +1,110 @@
+"""
+semantic_cache.py - Semantic Response Cache
+Returns a stored answer when a new question embeds (cosine) within
+SIMILARITY_THRESHOLD of a question that was already answered from the
+same retrieved chunks (so the answer matches the sources shown with it).
+Persisted to disk so answers survive restarts.
+Holds the MAX_ENTRIES most recent answers; the oldest is overwritten once full.
+"""
+
+import json
+import os
+import atexit
+import threading
+import numpy as np
+from typing import List, Optional
+
+CACHE_DIR            = os.path.join(os.path.dirname(__file__), "../.cache")
+SIMILARITY_THRESHOLD = 0.95
+MAX_ENTRIES          = 2048
+SAVE_EVERY           = 16    # persist after this many new entries
+
+
+class SemanticCache:
+    def __init__(self, dim: int, namespace: str):
+        """namespace: KB/embedder version, so answers never outlive the KB they came from."""
+        self.dim            = dim
+        self.vectors_path   = os.path.join(CACHE_DIR, f"semantic_cache_{namespace}.npy")
+        self.responses_path = os.path.join(CACHE_DIR, f"semantic_cache_{namespace}.json")
+        # Preallocated (MAX_ENTRIES, dim) ring of normalized query vectors; rows [:count] are live,
+        # row `next` is written next (the oldest entry once full)
+        self.vectors        = np.zeros((MAX_ENTRIES, dim), dtype=np.float32)
+        self.count          = 0
+        self.next           = 0
+        self.responses      = []
+        self.sources        = []   # chunk ids each response was generated from, per row
+        self._unsaved       = 0
+        self._lock          = threading.Lock()
+        self._load()
+        atexit.register(self.save)
+
+    def _load(self):
+        if not (os.path.exists(self.vectors_path) and os.path.exists(self.responses_path)):
+            return
+        try:
+            vectors = np.load(self.vectors_path)
+            with open(self.responses_path, "r") as f:
+                saved = json.load(f)
+            responses, sources = saved["responses"], saved["sources"]
+        except Exception:
+            return
+        n = len(responses)
+        if vectors.shape == (n, self.dim) and len(sources) == n and n <= MAX_ENTRIES:
+            self.vectors[:n]            = vectors
+            self.count, self.responses  = n, responses
+            self.sources                = sources
+            self.next                   = n % MAX_ENTRIES   # saved oldest-first
+
+    def lookup(self, query_vec: np.ndarray, sources: List[str]) -> Optional[str]:
+        """
+        Cached response for the nearest similar-enough past question that was
+        answered from exactly these chunk ids (same chunks, same Top-K), else None.
+        """
+        with self._lock:
+            if self.count == 0:
+                return None
+            sims = self.vectors[:self.count] @ query_vec.ravel()
+            hits = np.flatnonzero(sims > SIMILARITY_THRESHOLD)
+            for row in hits[np.argsort(-sims[hits])]:
+                if self.sources[row] == sources:
+                    return self.responses[row]
+        return None
+
+    def add(self, query_vec: np.ndarray, response: str, sources: List[str]):
+        with self._lock:
+            row = self.next
+            self.vectors[row] = query_vec.ravel()
+            if row == self.count:
+                self.count += 1
+                self.responses.append(response)
+                self.sources.append(list(sources))
+            else:
+                self.responses[row] = response
+                self.sources[row]   = list(sources)
+            self.next      = (row + 1) % MAX_ENTRIES
+            self._unsaved += 1
+            if self._unsaved >= SAVE_EVERY:
+                self._save_locked()
+
+    def save(self):
+        with self._lock:
+            if self._unsaved:
+                self._save_locked()
+
+    def _save_locked(self):
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            # Oldest first, so a reload resumes overwriting at the right row
+            order = np.r_[self.next:self.count, 0:self.next]
+            with open(self.vectors_path + ".tmp", "wb") as f:
+                np.save(f, self.vectors[order])
+            with open(self.responses_path + ".tmp", "w") as f:
+                json.dump({
+                    "responses": [self.responses[i] for i in order],
+                    "sources":   [self.sources[i] for i in order],
+                }, f)
+            os.replace(self.vectors_path + ".tmp", self.vectors_path)
+            os.replace(self.responses_path + ".tmp", self.responses_path)
+            self._unsaved = 0
+        except Exception as e:
+            print(f"[SemanticCache] Could not persist cache: {e}")
@@ -0,0 +1,42 @@
+import types
+import unittest
+from unittest import mock
+
+try:
+    from components import gemini
+except ImportError:   # google-generativeai not installed
+    gemini = None
+
+
+def _model(chunks):
+    """Stand-in model whose chat streams the given text chunks."""
+    response = [types.SimpleNamespace(parts=[text], text=text) for text in chunks]
+    chat     = types.SimpleNamespace(send_message=lambda *args, **kwargs: response)
+    return types.SimpleNamespace(start_chat=lambda history=None: chat)
+
+
+@unittest.skipIf(gemini is None, "google-generativeai not installed")
+class StreamLeakCheckTest(unittest.TestCase):
+    def stream(self, chunks):
+        messages = [{"role": "user", "parts": [repr(chunks)]}]   # unique per case: no exact-cache hits
+        with mock.patch.object(gemini, "get_model", return_value=_model(chunks)):
+            return "".join(gemini.call_gemini_stream(messages))
+
+    def test_word_split_across_chunks_is_not_a_leak(self):
+        for chunks in (
+            ["Short answer: a", "ctivities are graded weekly."],
+            ["The solution is", "n't something I can share."],
+        ):
+            self.assertEqual(self.stream(chunks), "".join(chunks))
+
+    def test_phrase_split_across_chunks_is_caught_before_display(self):
+        shown = []
+        with mock.patch.object(gemini, "get_model", return_value=_model(["Sure. The correct ", "answer is B."])):
+            with self.assertRaises(gemini.AnswerLeakage):
+                for text in gemini.call_gemini_stream([{"role": "user", "parts": ["leak"]}]):
+                    shown.append(text)
+        self.assertNotIn("answer is", "".join(shown))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+
+import numpy as np
+
+try:
+    from components._kernels import dot_topk
+except ImportError:   # numba not installed
+    dot_topk = None
+
+
+@unittest.skipIf(dot_topk is None, "numba not installed")
+class DotTopkTest(unittest.TestCase):
+    def test_matches_numpy_search(self):
+        rng = np.random.default_rng(0)
+        emb = rng.standard_normal((500, 384)).astype(np.float32)
+        emb /= np.linalg.norm(emb, axis=1, keepdims=True)
+        for k in (1, 4, 24, 500):
+            q      = emb[rng.integers(500)] + 0.1 * rng.standard_normal(384).astype(np.float32)
+            q      = (q / np.linalg.norm(q)).astype(np.float32)
+            scores = emb @ q
+            top    = np.argsort(-scores, kind="stable")[:k]
+
+            idx, top_scores = dot_topk(emb, q, k)
+            self.assertTrue((idx >= 0).all())
+            np.testing.assert_array_equal(idx, top)
+            np.testing.assert_allclose(top_scores, scores[top], rtol=1e-5, atol=1e-6)
+
+
+if __name__ == "__main__":
+    unittest.main()
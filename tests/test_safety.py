@@ -0,0 +1,22 @@
+import unittest
+
+from components.safety import classify_intent, is_blocked
+
+
+class ClassifyIntentTest(unittest.TestCase):
+    def test_keywords_match_case_insensitively(self):
+        self.assertEqual(classify_intent("How do I see my PROGRESS?"), "progress")
+        self.assertEqual(classify_intent("Can I Re-Enroll?"), "course")   # "enroll" outranks "re-enroll"
+
+    def test_non_ascii_case_variants_do_not_raise(self):
+        # "ſ" (long s) case-folds to "s" under Unicode IGNORECASE but not via str.lower()
+        for query in ("progreſs", "ſtreak", "ſhare my cert"):
+            self.assertEqual(classify_intent(query), "general")
+
+    def test_blocked_before_intent(self):
+        self.assertTrue(is_blocked("What is the correct answer to quiz 2?"))
+        self.assertEqual(classify_intent("What is the correct answer to quiz 2?"), "blocked")
+
+
+if __name__ == "__main__":
+    unittest.main()